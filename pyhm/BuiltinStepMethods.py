@@ -1,6 +1,10 @@
 import numpy as np
-import pdb
-import Utils
+import math
+import random
+import sys
+import collections
+import multiprocessing
+from . import Utils
 
 """
 This module contains definitions for algorithms to be used by Sampler objects
@@ -9,205 +13,474 @@ the definition for a basic Metropolis sampler. It would be nice to add in a
 routine for doing nested sampling.
 """
 
-class MetropolisHastings():
+# Gain and decay exponent of the Robbins-Monro updates that are applied
+# to the log step sizes at the end of each tune interval, and the maximum
+# distance from the target acceptance fraction for a tune interval to be
+# counted as a success:
+_RM_GAIN = 4.0
+_RM_DECAY = 0.6
+_ACCFRAC_TOL = 0.1
+
+
+def _target_accfrac( npars ):
+    """
+    Optimal acceptance fraction for a random walk Metropolis sampler
+    that perturbs npars parameters at a time.
+    """
+    if npars>4:
+        return 0.234
+    else:
+        return 0.44
+
+
+def _rm_factor( accfrac, target, t ):
+    """
+    Factor by which to multiply a step size after the tth tune interval
+    (counting from zero), from a Robbins-Monro update of the log step size.
+    """
+    gamma = _RM_GAIN*( t+1 )**( -_RM_DECAY )
+    return math.exp( gamma*( accfrac - target ) )
+
+
+def _decide( current_logp, new_logp, z ):
+    """
+    Metropolis acceptance rule, where z is a uniform random
+    draw on the interval [0,1).
+    """
+    beta = new_logp - current_logp
+    if beta>0:
+        return True
+    else:
+        return z<=math.exp( beta )
+
+
+def _compile_value_setter( stochs ):
+    """
+    Generates a straight-line function assign( values ) that installs
+    the elements of an array of parameter values into each of a fixed
+    list of Stochs, avoiding the loop overheads incurred every time the
+    Stochs must be synced with the array before evaluating the logp.
+    """
+    namespace = {}
+    src = 'def assign( values ):\n'
+    for i in range( len( stochs ) ):
+        namespace['s{0}'.format( i )] = stochs[i]
+        src += '    s{0}.value = values[{0}]\n'.format( i )
+    src += '    return None\n'
+    exec( compile( src, '<pre_tune>', 'exec' ), namespace )
+    return namespace['assign']
+
+
+# State shared with the worker processes forked by pre_tune:
+_pretune_state = None
+
+def _tune_single_worker( args ):
+    """
+    Tunes the step size of a single parameter inside a forked worker
+    process, using the state installed in _pretune_state beforehand.
+    """
+    j, seed = args
+    np.random.seed( seed )
+    random.seed( int( seed ) )
+    step_method, tune_args = _pretune_state
+    return step_method._tune_single( j, *tune_args )
+
+
+class _StepSizes( dict ):
+    """
+    Dictionary of step sizes that counts the modifications made to it,
+    so that an array of its values can be cached until it changes.
+    """
+
+    _version = 0
+
+    def _modified( self ):
+        self._version += 1
+
+    def __setitem__( self, key, value ):
+        dict.__setitem__( self, key, value )
+        self._modified()
+
+    def __delitem__( self, key ):
+        dict.__delitem__( self, key )
+        self._modified()
+
+    def update( self, *args, **kwargs ):
+        dict.update( self, *args, **kwargs )
+        self._modified()
+
+    def setdefault( self, key, default=None ):
+        self._modified()
+        return dict.setdefault( self, key, default )
+
+    def pop( self, *args ):
+        self._modified()
+        return dict.pop( self, *args )
+
+    def popitem( self ):
+        self._modified()
+        return dict.popitem( self )
+
+    def clear( self ):
+        dict.clear( self )
+        self._modified()
+
+
+class MetropolisHastings( object ):
     """
     Metropolis-Hastings sampling algorithm with Gaussian proposal distributions
     for each of the free parameters.
+
+    The keys of the parameters perturbed by propose() are given by the
+    touched_keys attribute, which is None until they are known; this
+    step method perturbs all of the free parameters at each step.
+
+    The accept/reject decisions for the most recent accfrac_window steps are
+    kept in the accepted_history attribute, and the fraction of these that
+    were accepted is available as the current_accfrac attribute.
     """
 
-    def __init__( self, proposal_distribution=None, step_sizes=None ):
+    # Fixed attribute layout, so that attribute lookups in the per-step
+    # methods do not go through an instance dictionary:
+    __slots__ = ( 'proposal_distribution', '_step_sizes', '_sigma_arr', '_sigma_version', '_key_order', \
+                  '_stoch_list', '_stoch_list_source', 'touched_keys', 'accepted_history', \
+                  '_naccepted_window', 'current_accfrac' )
+
+    def __init__( self, proposal_distribution=None, step_sizes=None, key_order=None, \
+                  accfrac_window=1000 ):
         """
         Initialises the sampling algorithm.
         """
-        if proposal_distribution==None:
+        if proposal_distribution is None:
             self.proposal_distribution = Utils.gaussian_random_draw
         else:
             self.proposal_distribution = proposal_distribution
 
-        if step_sizes==None:
+        if step_sizes is None:
             self.step_sizes = {}
         else:
             self.step_sizes = step_sizes
 
-    def propose( self, unobs_stochs ):
+        # Fixed ordering of the free parameters used to index the
+        # cached array of step sizes:
+        if key_order is None:
+            self._key_order = None
+        else:
+            self._key_order = list( key_order )
+        self.touched_keys = self._key_order
+        self._stoch_list = None
+        self._stoch_list_source = None
+
+        # Record of the most recent accept/reject decisions, along
+        # with the fraction of them that were accepted:
+        self.accepted_history = collections.deque( maxlen=accfrac_window )
+        self._naccepted_window = 0
+        self.current_accfrac = None
+
+    def _get_step_sizes( self ):
+        return self._step_sizes
+
+    def _set_step_sizes( self, step_sizes ):
+        # The step sizes are copied into a dictionary that records when
+        # it is modified, so that in-place edits invalidate the cached
+        # step size array:
+        if step_sizes is None:
+            self._step_sizes = None
+        else:
+            self._step_sizes = _StepSizes( step_sizes )
+        self._sigma_arr = None
+
+    step_sizes = property( _get_step_sizes, _set_step_sizes )
+
+    def _update_sigma_arr( self, keys ):
+        """
+        Caches the step sizes as an array ordered according to the
+        fixed key order. The array is only rebuilt if the step_sizes
+        dictionary has been modified since it was last built.
+        """
+        if ( self._key_order is None ) or ( len( self._key_order )!=len( keys ) ):
+            self._key_order = sorted( keys )
+            self.touched_keys = self._key_order
+            self._stoch_list_source = None
+            self._sigma_arr = None
+        if ( self._sigma_arr is None ) or ( self._sigma_version!=self._step_sizes._version ):
+            self._sigma_arr = np.array( [ self._step_sizes[k] for k in self._key_order ], dtype=float )
+            self._sigma_version = self._step_sizes._version
+
+    def _stochs_in_order( self, unobs_stochs ):
         """
-        Proposes a step in the parameter space.
+        Returns a list of the Stochs in unobs_stochs following the
+        fixed key order, so that the per-step updates index a list
+        rather than the dictionary. The list is cached until a
+        different dictionary is passed in or the key order changes.
         """
-        keys = unobs_stochs
-        for key in keys:
-            unobs_stochs[key].value += self.proposal_distribution( mu=0.0, sigma=self.step_sizes[key] )
+        if self._stoch_list_source is not unobs_stochs:
+            self._stoch_list = [ unobs_stochs[key] for key in self._key_order ]
+            self._stoch_list_source = unobs_stochs
+        return self._stoch_list
 
-    def decide( self, current_logp, new_logp ):
+    def _draw_steps( self, sigma, nsteps, rng=None ):
         """
-        Decides whether or not to accept the current step.
+        Draws nsteps proposal steps at once for parameters with step
+        sizes given by the array sigma, returning an array with shape
+        [ nsteps, len( sigma ) ]. Gaussian steps are drawn from the
+        numpy Generator rng if provided.
         """
-        beta = new_logp - current_logp
-        if beta>0:
-            decision = True
-        else: 
-            alpha = np.exp( beta )
-            z = np.random.random()
-            if z<=alpha:
-                decision = True
+        if self.proposal_distribution is Utils.gaussian_random_draw:
+            if rng is None:
+                steps = np.random.normal( 0.0, 1.0, size=[ nsteps, len( sigma ) ] )*sigma
             else:
-                decision = False
+                steps = rng.standard_normal( size=[ nsteps, len( sigma ) ] )*sigma
+        else:
+            steps = np.zeros( [ nsteps, len( sigma ) ] )
+            for i in range( nsteps ):
+                for j in range( len( sigma ) ):
+                    steps[i,j] = self.proposal_distribution( mu=0.0, sigma=sigma[j] )
+        return steps
+
+    def draw_proposals( self, unobs_stochs, nsteps, rng=None ):
+        """
+        Draws the proposal steps for nsteps iterations at once, returning
+        an array with shape [ nsteps, npars ] to be passed row-by-row to
+        propose(). If provided, rng is the numpy Generator to draw from.
+        """
+        self._update_sigma_arr( unobs_stochs )
+        return self._draw_steps( self._sigma_arr, nsteps, rng=rng )
+
+    def propose( self, unobs_stochs, steps=None ):
+        """
+        Proposes a step in the parameter space. If steps is provided,
+        it must be a row of the array returned by draw_proposals().
+        """
+        if steps is not None:
+            for stoch, step in zip( self._stochs_in_order( unobs_stochs ), steps ):
+                stoch.value += step
+        elif self.proposal_distribution is not Utils.gaussian_random_draw:
+            self._update_sigma_arr( unobs_stochs )
+            for stoch, sigma in zip( self._stochs_in_order( unobs_stochs ), self._sigma_arr ):
+                stoch.value += self.proposal_distribution( mu=0.0, sigma=sigma )
+        else:
+            # Draw the steps for all parameters with a single call:
+            self._update_sigma_arr( unobs_stochs )
+            draws = np.random.normal( 0.0, self._sigma_arr )
+            for stoch, draw in zip( self._stochs_in_order( unobs_stochs ), draws ):
+                stoch.value += draw
+
+    def decide( self, current_logp, new_logp, z=None ):
+        """
+        Decides whether or not to accept the current step, and
+        updates the running acceptance fraction accordingly. The
+        uniform deviate z is drawn here unless provided.
+        """
+        if z is None:
+            z = random.random()
+        decision = _decide( current_logp, new_logp, z )
+        history = self.accepted_history
+        if len( history )==history.maxlen:
+            self._naccepted_window -= history[0]
+        history.append( decision )
+        self._naccepted_window += decision
+        self.current_accfrac = self._naccepted_window/float( len( history ) )
         return decision
 
-    def pre_tune( self, mcmc, ntune_iterlim=0, tune_interval=None, verbose=False ):
+    def step( self, unobs_stochs, current_logp, get_logp, steps=None, z=None ):
+        """
+        Takes a single step by combining propose() and decide(), with
+        get_logp evaluating the log posterior at the proposed point.
+        Returns the proposed log posterior and the decision; rejected
+        proposals are left in place for the caller to restore.
+        """
+        if steps is None:
+            self.propose( unobs_stochs )
+        else:
+            for stoch, step in zip( self._stochs_in_order( unobs_stochs ), steps ):
+                stoch.value += step
+        new_logp = get_logp()
+        return new_logp, self.decide( current_logp, new_logp, z )
+
+    def _tune_single( self, j, mcmc, keys, stochs, assign, orig_values, orig_logp, current_values, \
+                      m, n, nconsecutive, verbose ):
         """
-        Adjusts step sizes to give a step acceptance rate of 20-35%.
+        Tunes the step size of the jth parameter by perturbing it while
+        holding the rest fixed at their original values. Returns the
+        tuned step size without modifying the step_sizes attribute.
         """
-        print '\nTuning step sizes...'
+        npars = len( keys )
+        i = 0 # iteration counter
+        t = 0 # tune interval counter
+        nsuccess = 0 # number of consecutive successes
+        target = _target_accfrac( 1 )
+        key_j = keys[j]
+        stoch_j = stochs[j]
+        step_size_j = self.step_sizes[key_j]
+
+        # Proceed to perturb the current parameter only, carrying
+        # on until the iteration limit has been reached:
+        accfrac_j = 0
+        while i<m+1:
+
+            # If there have been nconsecutive successful tune intervals
+            # in a row, break the loop:
+            if nsuccess>=nconsecutive:
+                step_size_j *= 0.3
+                break
+
+            # If the iteration limit has been reached, return an error:
+            elif i==m:
+                err_str = 'Aborting tuning - exceeded {0} steps'.format( m )
+                err_str += '\n...consider reducing tune_interval'
+                raise RuntimeError( err_str )
+
+            # Otherwise, proceed with the tuning:
+            else:
+                k = i%n # iteration number within current tuning interval
+                i += 1
+
+                # If this is the first iteration in a new tuning interval,
+                # reset all parameters to their original values to avoid
+                # drifting into low likelihood regions of parameter space;
+                # otherwise the logp of the current state is carried over
+                # from the previous iteration:
+                if k==0:
+                    assign( orig_values )
+                    current_values[j] = orig_values[j]
+                    current_logp = orig_logp
+                    naccepted_j = 0
+
+                    # Draw the steps and uniform deviates for the
+                    # whole tuning interval up front:
+                    prop_buf = self._draw_steps( np.array( [ step_size_j ] ), n )[:,0]
+                    unif_buf = np.random.random( n )
+
+                # Take a step in the current parameter while holding the 
+                # rest fixed:
+                stoch_j.value += prop_buf[k]
+
+                # Decide if the step is to be accepted:
+                new_logp = mcmc.logp()
+                accepted = _decide( current_logp, new_logp, unif_buf[k] )
+
+                # Update the value of the associated stochastic object:
+                if accepted:
+                    naccepted_j += 1
+                    current_logp = new_logp
+                    current_values[j] = stoch_j.value
+                else:
+                    stoch_j.value = current_values[j]
+
+                # If we have reached the end of the current tuning interval,
+                # adjust the step size of the current parameter based on the
+                # fraction of steps that were accepted:
+                if k==n-1:
+                    accfrac_j = naccepted_j/float( n )
+                    step_size_j *= _rm_factor( accfrac_j, target, t )
+                    t += 1
+
+            # If the end of a tune interval has been reached, check
+            # if all the acceptance rates were in the required range:
+            if ( k==n-1 ):
+                if abs( accfrac_j - target )<=_ACCFRAC_TOL:
+                    nsuccess += 1
+                else:
+                    nsuccess = 0
+                if verbose==True:
+                    print( '\nPre-tuning update for parameter {0} ({1} of {2}):'\
+                           .format( key_j, j+1, npars ) )
+                    print( 'Consecutive successes = {0}'.format( nsuccess ) )
+                    print( 'Accepted fraction from last {0} steps = {1}'\
+                           .format( n, accfrac_j ) )
+                    print( '(require {0} consecutive intervals with acceptance rate {1:.2f}-{2:.2f})'\
+                           .format( nconsecutive, target-_ACCFRAC_TOL, target+_ACCFRAC_TOL ) )
+                    print( 'Median value of last {0} steps: median( {1} )={2} '\
+                           .format( n, key_j, np.median( current_values[j] ) ) )
+                    print( 'Starting value for comparison: {0}'.format( orig_values[j] ) )
+
+        return step_size_j
+
+    def pre_tune( self, mcmc, ntune_iterlim=0, tune_interval=None, verbose=False, \
+                  nprocesses=1, nchains=1 ):
+        """
+        Adjusts step sizes to give a step acceptance rate close to the
+        optimal value for random walk Metropolis, i.e. 0.44 for up to
+        four parameters and 0.234 for more than four parameters.
+        If nprocesses>1, the initial per-parameter tuning is spread
+        across that many forked worker processes on Linux, and is done
+        in this process on other platforms. If nchains>1, the
+        subsequent joint rescaling of the step sizes uses the pooled
+        acceptance fraction of that many chains, which gives a less
+        noisy estimate per tune interval for larger models.
+        """
+        print( '\nTuning step sizes...' )
         m = ntune_iterlim
         n = tune_interval
         unobs_stochs = mcmc.model.free
-        keys = unobs_stochs.keys()
+        keys = list( unobs_stochs.keys() )
         step_sizes = self.step_sizes
-        if self.step_sizes==None:
+        if self.step_sizes is None:
             self.step_sizes = {}
             for key in keys:
                 self.step_sizes[key] = 1.
         npars = len( keys )
-
-        # Make a record of the starting values for each parameter:
-        orig_stoch_values = {}
-        for key in keys:
-            orig_stoch_values[key] = unobs_stochs[key].value
+        self._key_order = list( keys )
+        self.touched_keys = self._key_order
+        self._stoch_list_source = None
+        self._sigma_arr = None
+
+        # Bind the stochastics in a fixed order and make a record of
+        # the starting values for each parameter. The parameter values
+        # are handled as arrays and only installed in the stochastics
+        # when the logp needs to be evaluated:
+        stochs = [ unobs_stochs[key] for key in keys ]
+        assign = _compile_value_setter( stochs )
+        orig_values = np.array( [ s.value for s in stochs ], dtype=float )
+        orig_logp = mcmc.logp()
 
         # First of all, we will tune the relative step sizes for
         # all of the parameters by taking steps one parameter at
-        # a time. Initialise the arrays that will record the results:
-        tuning_chains = {}
-        for key in keys:
-            tuning_chains[key] = {}
-        current_values = {}
-        for key in keys:
-            tuning_chains[key]['values'] = np.zeros( n, dtype=unobs_stochs[key].dtype )
-            tuning_chains[key]['logp'] = np.zeros( n, dtype=float )
-            tuning_chains[key]['accepted'] = np.zeros( n, dtype=int )
-            current_values[key] = unobs_stochs[key].value
-
-        # Define variables that track the total number of tuning
-        # steps that have been taken and the consecutive number of
-        # successful tune_intervals:
+        # a time:
+        current_values = orig_values.copy()
+
+        # Define the number of consecutive successful tune intervals
+        # that are required for each parameter. The parameters are
+        # independent of one another at this stage, so they can be
+        # tuned in separate processes if requested:
         nconsecutive = 5
+        tune_args = ( mcmc, keys, stochs, assign, orig_values, orig_logp, current_values, \
+                      m, n, nconsecutive, verbose )
+        if ( nprocesses>1 ) and ( npars>1 ) and sys.platform.startswith( 'linux' ):
+            global _pretune_state
+            _pretune_state = ( self, tune_args )
+            seeds = np.random.randint( 0, 2**31-1, size=npars )
+            pool = multiprocessing.get_context( 'fork' ).Pool( processes=min( [ nprocesses, npars ] ) )
+            try:
+                tuned_step_sizes = pool.map( _tune_single_worker, zip( range( npars ), seeds ) )
+            finally:
+                pool.close()
+                pool.join()
+                _pretune_state = None
+        else:
+            tuned_step_sizes = []
+            for j in range( npars ):
+                tuned_step_sizes += [ self._tune_single( j, *tune_args ) ]
         for j in range( npars ):
-
-            i = 0 # iteration counter
-            nsuccess = 0 # number of consecutive successes
-            key_j = keys[j]
-
-            # Proceed to perturb the current parameter only, carrying
-            # on until the iteration limit has been reached:
-            accfrac_j = 0
-            while i<m+1:
-
-                step_size_j = self.step_sizes[key_j]
-
-                # If there have been nconsecutive successful tune intervals
-                # in a row, break the loop:
-                if nsuccess>=nconsecutive:
-                    self.step_sizes[key_j] *= 0.3
-                    break
-
-                # If the iteration limit has been reached, return an error:
-                elif i==m:
-                    err_str = 'Aborting tuning - exceeded {0} steps'.format( m )
-                    err_str += '\n...consider reducing tune_interval'
-                    raise StandardError( err_str )
-
-                # Otherwise, proceed with the tuning:
-                else:
-                    k = i%n # iteration number within current tuning interval
-                    i += 1
-                    current_logp = mcmc.logp()
-
-                    # If this is the first iteration in a new tuning interval,
-                    # reset all parameters to their original values to avoid
-                    # drifting into low likelihood regions of parameter space:
-                    if k==0:
-                        for key in keys:
-                            unobs_stochs[key].value = orig_stoch_values[key]
-
-                    # Take a step in the current parameter while holding the 
-                    # rest fixed:
-                    step_size_j = self.step_sizes[key_j]
-                    unobs_stochs[key_j].value += self.proposal_distribution( mu=0.0, sigma=step_size_j )
-
-                    # Decide if the step is to be accepted:
-                    new_logp = mcmc.logp()
-                    tuning_chains[key_j]['accepted'][k] = self.decide( current_logp, new_logp )
-
-                    # Update the value of the associated stochastic object:
-                    if ( tuning_chains[key_j]['accepted'][k]==True ):
-                        current_logp = new_logp
-                        current_values[key_j] = unobs_stochs[key_j].value
-                    else:
-                        unobs_stochs[key_j].value = current_values[key_j]
-
-                    # Add the result to the chain:
-                    tuning_chains[key_j]['values'][k] = current_values[key_j]
-                    tuning_chains[key_j]['logp'][k] = mcmc.model.logp()
-                    
-                    # If we have reached the end of the current tuning interval,
-                    # adjust the step size of the current parameter based on the
-                    # fraction of steps that were accepted:
-                    if k==n-1:
-                        naccepted_j  = np.sum( tuning_chains[key_j]['accepted'] )
-                        accfrac_j = naccepted_j/float( n )
-                        if ( accfrac_j<=0.01 ):
-                            self.step_sizes[key_j] /= 5.0
-                        elif ( accfrac_j>0.01 )*( accfrac_j<=0.05 ):
-                            self.step_sizes[key_j] /= 2.0
-                        elif ( accfrac_j>0.05 )*( accfrac_j<=0.10 ):
-                            self.step_sizes[key_j] /= 1.5
-                        elif ( accfrac_j>0.10 )*( accfrac_j<=0.15 ):
-                            self.step_sizes[key_j] /= 1.2
-                        elif ( accfrac_j>0.15 )*( accfrac_j<0.2 ):
-                            self.step_sizes[key_j] /= 1.1
-                        elif ( accfrac_j>0.20 )*( accfrac_j<0.25 ):
-                            self.step_sizes[key_j] /= 1.01
-                        elif ( accfrac_j>0.35 )*( accfrac_j<=0.40 ):
-                            self.step_sizes[key_j] *= 1.01
-                        elif ( accfrac_j>0.40 )*( accfrac_j<=0.45 ):
-                            self.step_sizes[key_j] *= 1.1
-                        elif ( accfrac_j>0.45 )*( accfrac_j<=0.50 ):
-                            self.step_sizes[key_j] *= 1.2
-                        elif ( accfrac_j>0.50 )*( accfrac_j<=0.55 ):
-                            self.step_sizes[key_j] *= 1.5
-                        elif ( accfrac_j>0.55 )*( accfrac_j<=0.60 ):
-                            self.step_sizes[key_j] *= 2.0
-                        elif ( accfrac_j>0.60 ):
-                            self.step_sizes[key_j] *= 5.0
-
-                # If the end of a tune interval has been reached, check
-                # if all the acceptance rates were in the required range:
-                if ( k==n-1 ):
-                    if ( accfrac_j>=0.2 )*( accfrac_j<=0.40 ):
-                        nsuccess += 1
-                    else:
-                        nsuccess = 0
-                    if verbose==True:
-                        print '\nPre-tuning update for parameter {0} ({1} of {2}):'\
-                              .format( key_j, j+1, npars )
-                        print 'Consecutive successes = {0}'.format( nsuccess )
-                        print 'Accepted fraction from last {0} steps = {1}'\
-                              .format( n, accfrac_j )
-                        print '(require {0} consecutive intervals with acceptance rate 0.2-0.4)'\
-                              .format( nconsecutive )
-                        print 'Median value of last {0} steps: median( {1} )={2} '\
-                              .format( n, key_j, np.median( current_values[key_j] ) )
-                        print 'Starting value for comparison: {0}'.format( orig_stoch_values[key_j] )
+            self.step_sizes[keys[j]] = tuned_step_sizes[j]
 
         # Having tuned the relative step sizes, we must now rescale them
-        # together to refine the joint step sizes:
+        # together to refine the joint step sizes. This is done using
+        # nchains chains that each start from the original values, with
+        # the acceptance fraction pooled across all of the chains:
         i = 0
+        t = 0
         nsuccess = 0
+        target = _target_accfrac( npars )
         rescale_factor = 1.0/np.sqrt( npars )
-        tuning_chain = np.zeros( n, dtype=int )
-        current_logp = mcmc.logp()
+        nchains = max( [ 1, int( nchains ) ] )
+        chain_values = np.zeros( [ nchains, npars ], dtype=float )
+        chain_logp = np.zeros( nchains )
+        new_logp = np.zeros( nchains )
+        self._update_sigma_arr( keys )
         if verbose==True:
-            print '\n\nNow tuning the step sizes simultaneously...\n'
+            print( '\n\nNow tuning the step sizes simultaneously...\n' )
         while i<m+1:
 
             # If there have been nconsecutive successful tune intervals
@@ -219,7 +492,7 @@ class MetropolisHastings():
             elif i==m:
                 err_str = 'Aborting tuning - exceeded {0} steps'.format( m )
                 err_str += '\n...consider reducing tune_interval'
-                raise StandardError( err_str )
+                raise RuntimeError( err_str )
 
             # Otherwise, proceed with the tuning:
             else:
@@ -227,70 +500,66 @@ class MetropolisHastings():
                 i += 1
                 
                 # If this is the first iteration in a new tuning interval,
-                # reset all parameters to their original values to avoid
-                # drifting into low likelihood regions of parameter space:
+                # reset all chains to the original values to avoid drifting
+                # into low likelihood regions of parameter space, and rescale
+                # the step sizes by a constant factor before drawing the steps
+                # for the whole interval:
                 if k==0:
-                    for key in keys:
-                        unobs_stochs[key].value = orig_stoch_values[key]
-                    
-                # Take a step in all of the parameters simultaneously:
-                for key in keys:
-
-                    # If this is the first iteration in a new tuning interval,
-                    # rescale the step sizes by a constant factor before
-                    # taking the step:
-                    if k==0:
-                        self.step_sizes[key] *= rescale_factor
-                    unobs_stochs[key].value += self.proposal_distribution( mu=0.0, sigma=self.step_sizes[key] )
-
-                # Decide if the step is to be accepted:
-                new_logp = mcmc.logp()
-                tuning_chain[k] = self.decide( current_logp, new_logp )
-                if ( tuning_chain[k]==True ):
-                    current_logp = new_logp
-                    for key in keys:
-                        current_values[key] = unobs_stochs[key].value
-                else:
-                    for key in keys:
-                        unobs_stochs[key].value = current_values[key]
+                    chain_values[:,:] = orig_values
+                    chain_logp[:] = orig_logp
+                    naccepted = 0
+                    accprob_sum = 0.0
+                    self._sigma_arr *= rescale_factor
+                    prop_buf = self._draw_steps( self._sigma_arr, n*nchains )
+                    prop_buf = prop_buf.reshape( [ n, nchains, npars ] )
+                    unif_buf = np.random.random( [ n, nchains ] )
+
+                # Take a step in all of the parameters simultaneously
+                # for every chain, then evaluate the logp of each chain
+                # in turn:
+                new_values = chain_values + prop_buf[k]
+                for c in range( nchains ):
+                    assign( new_values[c] )
+                    new_logp[c] = mcmc.logp()
+
+                # Decide which of the steps are to be accepted:
+                alpha = np.nan_to_num( np.exp( np.minimum( new_logp - chain_logp, 0 ) ) )
+                accepted = ( unif_buf[k]<=alpha )
+                naccepted += np.count_nonzero( accepted )
+                accprob_sum += np.sum( alpha )
+                chain_values[accepted] = new_values[accepted]
+                chain_logp[accepted] = new_logp[accepted]
 
                 # If we have reached the end of the current tuning interval,
-                # adjust the step size rescaling factor based on the fraction
-                # of steps that were accepted:
+                # adjust the step size rescaling factor. This is based on the
+                # mean acceptance probability of the proposals across all chains
+                # rather than the fraction that happened to be accepted, as the
+                # former is a lower variance estimate of the acceptance rate:
                 if k==n-1:
-                    naccepted = np.sum( tuning_chain )
-                    accfrac = naccepted/float( n )
-                    if ( accfrac>=0.2 )*( accfrac<=0.35 ):
+                    accfrac = naccepted/float( n*nchains )
+                    accprob = accprob_sum/float( n*nchains )
+                    self.current_accfrac = accfrac
+                    if abs( accprob - target )<=_ACCFRAC_TOL:
                         nsuccess += 1
-                        rescale_factor = 1.0
                     else:
                         nsuccess = 0
-                        if ( accfrac<=0.01 ):
-                            rescale_factor = 1./2.0
-                        elif ( accfrac>0.01 )*( accfrac<=0.05 ):
-                            rescale_factor = 1./1.5
-                        elif ( accfrac>0.05 )*( accfrac<=0.10 ):
-                            rescale_factor = 1./1.2
-                        elif ( accfrac>0.10 )*( accfrac<=0.15 ):
-                            rescale_factor = 1./1.1
-                        elif ( accfrac>0.15 )*( accfrac<0.2 ):
-                            rescale_factor = 1./1.01
-                        elif ( accfrac>0.35 )*( accfrac<=0.45 ):
-                            rescale_factor = 1.01
-                        elif ( accfrac>0.45 )*( accfrac<=0.50 ):
-                            rescale_factor = 1.1
-                        elif ( accfrac>0.50 )*( accfrac<=0.55 ):
-                            rescale_factor = 1.2
-                        elif ( accfrac>0.55 )*( accfrac<=0.60 ):
-                            rescale_factor = 1.5
-                        elif ( accfrac>0.60 ):
-                            rescale_factor = 2.
+                    rescale_factor = _rm_factor( accprob, target, t )
+                    t += 1
 
                     if verbose==True:
-                        print 'Consecutive successes = {0}'.format( nsuccess )
-                        print 'Accepted fraction from last {0} steps = {1}'\
-                              .format( n, accfrac )
+                        print( 'Consecutive successes = {0}'.format( nsuccess ) )
+                        print( 'Accepted fraction from last {0} steps = {1}'\
+                               .format( n, accfrac ) )
+                        print( 'Mean acceptance probability from last {0} steps = {1}'\
+                               .format( n, accprob ) )
+
+        # Leave the parameters at the current state of the first chain:
+        assign( chain_values[0] )
+
+        # Install the jointly rescaled step sizes:
+        for key, sigma in zip( self._key_order, self._sigma_arr ):
+            self.step_sizes[key] = sigma
 
-        print 'Finished tuning with acceptance rate of {0:.1f}%'.format( accfrac*100 )
+        print( 'Finished tuning with acceptance rate of {0:.1f}%'.format( accfrac*100 ) )
 
         return None
@@ -1,8 +1,7 @@
 import numpy as np
-import pdb
 import math
 import scipy.special
-import ModelObjs, Utils
+from . import ModelObjs, Utils
 
 """
 This module contains definitions for Stochs with standard probability
@@ -28,7 +27,7 @@ def Gaussian( name, mu=0.0, sigma=1.0, value=None, observed=False, dtype=float )
     sigma_value = parent_values['sigma']
     
     def logp( value=value, mu=mu_value, sigma=sigma_value ):
-        if np.rank( value )==0:
+        if np.ndim( value )==0:
             logp = -0.5*math.log( 2*np.pi*( sigma**2. ) ) \
                    - ( ( value - mu )**2. )/( 2*( sigma**2. ) )
         else:
@@ -39,7 +38,7 @@ def Gaussian( name, mu=0.0, sigma=1.0, value=None, observed=False, dtype=float )
     def random( mu=mu_value, sigma=sigma_value ):
         return np.random.normal( mu, sigma )
 
-    if value==None:
+    if value is None:
         value = random( mu=mu_value, sigma=sigma_value )
     parents = { 'mu':mu, 'sigma':sigma }
     dictionary = { 'name':name, 'observed':observed, 'dtype':dtype, 'parents':parents, \
@@ -65,7 +64,7 @@ def Uniform( name, lower=0.0, upper=1.0, value=None, observed=False, dtype=float
     lower_value = parent_values['lower']
     upper_value = parent_values['upper']
 
-    if ( value!=None )*( np.rank( value )>0 ):
+    if ( value is not None )*( np.ndim( value )>0 ):
         n = len( value.flatten() )
     else:
         n = 1
@@ -83,7 +82,7 @@ def Uniform( name, lower=0.0, upper=1.0, value=None, observed=False, dtype=float
         else:
             return np.random.uniform( low=lower, high=upper )
 
-    if value==None:
+    if value is None:
         value = random( lower=lower_value, upper=upper_value )
     parents = { 'lower':lower, 'upper':upper }
     dictionary = { 'name':name, 'observed':observed, 'dtype':dtype, 'parents':parents, \
@@ -120,7 +119,7 @@ def Gamma( name, alpha=1, beta=1, value=None, observed=False, dtype=float ):
         else:
 
             # The Python math routine is faster than numpy for single-valued inputs:
-            if np.rank( value )==0:
+            if np.ndim( value )==0:
                 logp_value = -math.lgamma( alpha ) + alpha*math.log( beta ) \
                              + (alpha-1)*math.log( value ) - beta*value
 
@@ -138,7 +137,7 @@ def Gamma( name, alpha=1, beta=1, value=None, observed=False, dtype=float ):
         err_str = 'alpha and beta parameters must both be >0'
         raise ValueError( err_str )
 
-    if value==None:
+    if value is None:
         value = random( alpha=alpha_value, beta=beta_value )
     parents = { 'alpha':alpha, 'beta':beta }
     dictionary = { 'name':name, 'observed':observed, 'dtype':dtype, 'parents':parents, \
@@ -1,11 +1,61 @@
-import sys, inspect, pdb
-import ModelObjs
+import sys, inspect
+from . import ModelObjs
 
 """
 This module contains definitions for function decorators that are used
 to instantiate instances of objects such as Stochs.
 """
 
+def signature_args( func ):
+    """
+    Returns the names of the arguments of a function, along with
+    the default values of those arguments that have them.
+    """
+
+    # Only positional arguments are counted, as for getargspec(), so
+    # that *args and **kwargs are ignored:
+    params = [ p for p in inspect.signature( func ).parameters.values() \
+               if p.kind in ( p.POSITIONAL_OR_KEYWORD, p.POSITIONAL_ONLY ) ]
+    args = [ p.name for p in params ]
+    defaults = [ p.default for p in params if p.default is not inspect.Parameter.empty ]
+
+    return args, defaults
+
+
+def extract_inner_functions( func ):
+    """
+    Runs a decorated function that defines logp and random functions
+    without returning them, and retrieves them from its local namespace
+    as it returns. This relies on installing a trace function, so it is
+    only used for decorated functions that do not return logp and random
+    explicitly. The trace function only follows the decorated function's
+    own frame and is removed as soon as that frame returns.
+    """
+
+    functions = { 'logp':None, 'random':None }
+    code = func.__code__
+    previous = sys.gettrace()
+    def local_probe( frame, event, arg ):
+        if event=='return':
+            l = frame.f_locals
+            for key in functions:
+                functions[key] = l.get( key )
+            sys.settrace( previous )
+        return local_probe
+    def probe_func( frame, event, arg ):
+        if frame.f_code is code:
+            frame.f_trace_lines = False
+            return local_probe
+        return None
+    sys.settrace( probe_func )
+    try:
+        func()
+    finally:
+        sys.settrace( previous )
+
+    return functions
+
+
 def stochastic( func=None, observed=False, dtype=float ):
     """
     Decorator for the Stoch class.
@@ -25,6 +75,8 @@ def stochastic( func=None, observed=False, dtype=float ):
                 ...
                 return random_draw
 
+            return logp, random
+
       The above will instantiate an unobserved Stoch named A (this will be
       both the name of the variable and it's identity key) with current value equal
       to xvalue, and with parameters par1 and par2.
@@ -45,9 +97,15 @@ def stochastic( func=None, observed=False, dtype=float ):
                 ...
                 return logp_value
 
+            return logp
+
       Unlike the unobserved Stoch case, it is necessary to provide an external
       argument for the value. A random() function is not needed, as the value of an
       observed Stoch is fixed to its 'observed' value.
+
+      Returning the logp (and random) functions is optional. If nothing is
+      returned, they are instead retrieved from the local namespace of the
+      decorated function by tracing its execution, which is slower.
     """
 
     def instantiate_stochastic( func ):
@@ -59,26 +117,27 @@ def stochastic( func=None, observed=False, dtype=float ):
         dictionary['observed'] = observed
         dictionary['dtype'] = dtype
 
-        # Identify if logp and random functions
-        # have been passed in:
+        # Identify if logp and random functions have been passed
+        # in. These are preferably returned by the decorated function,
+        # either as logp alone or as a ( logp, random ) tuple:
         dictionary['logp'] = None
         dictionary['random'] = None
-        keys = ['logp', 'random']
-        def probe_func( frame, event, arg ):
-            if event=='return':
-                l = frame.f_locals
-                for key in keys:
-                    dictionary[key] = l.get( key )
-                sys.settrace( None )
-            return probe_func
-        sys.settrace( probe_func )
-        func()
+        # Legacy decorated functions that return nothing are run a
+        # second time under a trace probe; their bodies only define
+        # closures, so this is harmless:
+        returned = func()
+        if returned is None:
+            dictionary.update( extract_inner_functions( func ) )
+        elif callable( returned ):
+            dictionary['logp'] = returned
+        else:
+            dictionary.update( zip( [ 'logp', 'random' ], returned ) )
 
-        if dictionary['logp']==None:
+        if dictionary['logp'] is None:
             err_str = '\nStochastic {0} logp not defined'\
                       .format( dictionary['name'] )
             raise ValueError(err_str)
-        if ( dictionary['random']!=None )*( dictionary['observed']==True ):
+        if ( dictionary['random'] is not None )*( dictionary['observed']==True ):
             err_str = '\nCan\'t have random function defined for Stochastic {0}'\
                       .format( dictionary['name'] )
             err_str += 'because \'observed\' is set to True'
@@ -89,9 +148,7 @@ def stochastic( func=None, observed=False, dtype=float ):
         # those keyword arguments passed to the function not
         # including the 'value' argument:
         parents = {}
-        ( args, varargs, varkw, defaults ) = inspect.getargspec( func )
-        if defaults==None:
-            defaults = []
+        ( args, defaults ) = signature_args( func )
 
         # Check if value has been provided:
         if ( 'value' in args ):
@@ -1,9 +1,8 @@
 import numpy as np
-import inspect
-import sys, pdb
-import Utils
-import Optimizers
-import BuiltinStepMethods
+import random
+from . import Utils
+from . import Optimizers
+from . import BuiltinStepMethods
 
 """
 This module defines the fundamental objects used for building models and
@@ -20,7 +19,7 @@ class Sampler():
     Class definition for a Sampler object.
 
     CALLING 
-      sampler = pyhm.Sampler( stochastic_dict )
+      sampler = pyhm.Sampler( stochastic_dict, seed=None )
 
     BUILT-IN ROUTINES
       use_step_method
@@ -38,12 +37,25 @@ class Sampler():
       using the standard Metropolis-Hastings algorithm. However, the code is 
       intended to be fully extensible - other sampling algorithms should be added
       For instance, a high priority is to add a NestedSampling option.
+
+      If seed is provided, it is used to seed the numpy Generator stored
+      as the rng attribute, from which the proposal steps and the uniform
+      deviates for the accept/reject decisions are drawn during sampling.
+      It also seeds the global numpy and standard library random number
+      generators, which are only used by pre-tuning, by custom proposal
+      distributions, and by the MetropolisHastings propose() and decide()
+      methods when they are called without precomputed steps or uniform
+      deviates.
     """
     
-    def __init__( self, stochastics ):
+    def __init__( self, stochastics, seed=None ):
         """
         Initialises a blank sampler object.
         """
+        if seed is not None:
+            np.random.seed( seed )
+            random.seed( seed )
+        self.rng = np.random.default_rng( seed )
         self.model = Model( stochastics )
         Utils.update_attributes( self, stochastics )
         self.chain = {}
@@ -58,14 +70,17 @@ class Sampler():
         Utils.assign_step_method( self, step_method, **kwargs )
 
     def sample( self, nsteps=1000, ntune_iterlim=None, tune_interval=None, show_progressbar=True, \
-                pickle_chain=None, thin_before_pickling=1, verbose=False ):
+                pickle_chain=None, thin_before_pickling=1, verbose=False, nchains=1, nworkers=None, \
+                logp_fn=None, thin_during_sampling=1 ):
         """
         Sample from the posterior distribution and optionally pickle the output.
         """        
         self.show_progressbar = show_progressbar
         Utils.sample( self, nsteps=nsteps, ntune_iterlim=ntune_iterlim, \
-                      tune_interval=tune_interval, verbose=verbose )
-        if pickle_chain!=None:
+                      tune_interval=tune_interval, verbose=verbose, \
+                      nchains=nchains, nworkers=nworkers, logp_fn=logp_fn, \
+                      thin_during_sampling=thin_during_sampling )
+        if pickle_chain is not None:
             Utils.pickle_chain( self, pickle_chain=pickle_chain, thin_before_pickling=thin_before_pickling )
 
     def draw_from_prior( self ):
@@ -155,9 +170,8 @@ class Model():
         
     def logp( self ):
         logp = 0.0
-        keys = self.stochastics.keys()
-        for key in keys:
-            logp += self.stochastics[key].logp()
+        for stochastic in self.stochastics.values():
+            logp += stochastic.logp()
         return logp
 
     def draw_from_prior( self ):
@@ -227,6 +241,8 @@ class Stoch():
                     ...
                     return random_draw
 
+                return logp, random
+
     In addition, a number of basic Stochs are built-in to pyhm in the
     BuiltinStochastics module, including those with Gaussian, Uniform, and Gamma
     probability distributions.
@@ -241,26 +257,35 @@ class Stoch():
         self.value = dictionary['value']
         self._logp_basefunc = dictionary['logp']
         self._random_basefunc = dictionary['random']
-        if ( self.observed==True )*( self.value==None ):
+        # Built on first use, as the parents do not change between steps:
+        self._parents_plan = None
+        if ( self.observed==True )*( self.value is None ):
             err_str = 'Observed variables must have value defined'
             raise ValueError(err_str)
 
+    def _get_parents_plan( self ):
+        plan = self._parents_plan
+        if ( plan is None ) or ( len( plan )!=len( self.parents ) ):
+            plan = Utils.extraction_plan( self.parents )
+            self._parents_plan = plan
+        return plan
+
     def logp( self ):
         logp_func = self._logp_basefunc
-        if self.value==None:
+        if self.value is None:
             err_str = '\nStochastic {0} value not defined - can\'t compute logp'.\
                       format( self.name )
             raise ValueError(err_str)
-        kwargs = Utils.extract_stochastics_values( self.parents )
+        kwargs = Utils.extract_stochastics_values( self.parents, plan=self._get_parents_plan() )
         logp_value = logp_func( value=self.value, **kwargs )
         return logp_value
 
     def random( self ):
         random_func = self._random_basefunc
-        if random_func==None:
+        if random_func is None:
             random_draw = Utils.blank_random
         else:
-            kwargs = Utils.extract_stochastics_values( self.parents )
+            kwargs = Utils.extract_stochastics_values( self.parents, plan=self._get_parents_plan() )
             random_draw = random_func( **kwargs )
         self.value = random_draw
         return random_draw
@@ -1,7 +1,7 @@
 import numpy as np
 import scipy.optimize
-import Utils
-import sys, pdb, warnings
+from . import Utils
+import warnings
 
 """
 This module defines the optimization algorithms for MAP objects.
@@ -27,7 +27,7 @@ def optimize( MAP, method='neldermead', maxiter=1000, ftol=None, verbose=False )
     
     model = MAP.model
     free_stochastics = Utils.unobserved_stochastics( model.stochastics )
-    keys = free_stochastics.keys()
+    keys = list( free_stochastics.keys() )
 
     # Go through each of the stochastics, and unpack all of
     # their values into a single array; as part of this, fill
@@ -39,7 +39,7 @@ def optimize( MAP, method='neldermead', maxiter=1000, ftol=None, verbose=False )
     stochixs = np.array( [] )
     for i in range( nstoch ):
         value = free_stochastics[keys[i]].value
-        if np.rank( value )==0:
+        if np.ndim( value )==0:
             x0 = np.concatenate( [ x0, [ value ] ] )
             stochixs = np.concatenate( [ stochixs, [ i ] ] )
         else:
@@ -61,7 +61,7 @@ def optimize( MAP, method='neldermead', maxiter=1000, ftol=None, verbose=False )
         for i in range( nstoch ):
             ixs = ( stochixs==i )
             x_val = x[ixs]
-            if ( np.rank( x_val )==1 )*( len( x_val )==1 ):
+            if ( np.ndim( x_val )==1 )*( len( x_val )==1 ):
                 model.stochastics[keys[i]].value = float( x[ixs] )
             else:
                 model.stochastics[keys[i]].value = np.array( x[ixs] )
@@ -69,16 +69,16 @@ def optimize( MAP, method='neldermead', maxiter=1000, ftol=None, verbose=False )
 
     # Run the optimizer specified in the call:
     if method=='neldermead':
-        if ftol==None:
+        if ftol is None:
             ftol = 0.01
         xopt = scipy.optimize.fmin( func, x0, ftol=ftol, maxiter=maxiter, full_output=0, disp=verbose )
     elif method=='powell':
-        if ftol==None:
+        if ftol is None:
             ftol = 0.01
         xopt = scipy.optimize.fmin_powell( func, x0, ftol=ftol, maxiter=maxiter, full_output=0, disp=verbose )
     elif method=='conjgrad':
-        if ftol!=None:
-            print ''
+        if ftol is not None:
+            print( '' )
             warn_str = '\nConjugate gradient does not accept ftol (ignoring)\n'
             warnings.warn( warn_str )
         xopt = scipy.optimize.fmin_cg( func, x0, maxiter=maxiter, full_output=0, disp=verbose )
@@ -88,7 +88,7 @@ def optimize( MAP, method='neldermead', maxiter=1000, ftol=None, verbose=False )
     for i in range( nstoch ):
         ixs = ( stochixs==i )
         xopt_i = xopt[ixs]
-        if np.rank( xopt_i )==0:
+        if np.ndim( xopt_i )==0:
             free_stochastics[keys[i]].value = float( xopt_i )
         else:
             if len( xopt_i )==1:
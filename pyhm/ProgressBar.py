@@ -26,9 +26,9 @@ class progressbar:
 
     def animate_noipython( self, iter ):
         if sys.platform.lower().startswith( 'win' ):
-            print self, '\r',
+            print( self, '\r', end='' )
         else:
-            print self, chr( 27 ) + '[A'
+            print( self, chr( 27 ) + '[A' )
         self.update_iteration( iter )
         # time.sleep( 0.5 )
 
@@ -38,7 +38,7 @@ class progressbar:
         except Exception:
             # terminal IPython has no clear_output
             pass
-        print '\r', self,
+        print( '\r', self, end='' )
         sys.stdout.flush()
         self.update_iteration( iter )
 
@@ -51,7 +51,7 @@ class progressbar:
         all_full = self.width - 2
         num_hashes = int( round( ( percent_done / 100.0 ) * all_full ) )
         self.prog_bar = '[' + self.fill_char * num_hashes + ' ' * ( all_full - num_hashes ) + ']'
-        pct_place = ( len( self.prog_bar ) / 2 ) - len( str( percent_done ) )
+        pct_place = ( len( self.prog_bar ) // 2 ) - len( str( percent_done ) )
         pct_string = '%d%%' % percent_done
         self.prog_bar = self.prog_bar[0:pct_place] + \
             ( pct_string + self.prog_bar[pct_place + len( pct_string ):] )
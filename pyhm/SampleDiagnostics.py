@@ -1,6 +1,5 @@
 import matplotlib.pyplot as plt
 import numpy as np
-import pdb
 import copy
 
 """
@@ -36,7 +35,7 @@ def plot_running_chain_means( sampler, thin_before_plotting=None ):
     for i in range( npars ):
         rmeans[:,i] /= stepcount
 
-    if thin_before_plotting==None:
+    if thin_before_plotting is None:
         if nsteps<2000:
             thin = 1
         else:
@@ -78,7 +77,7 @@ def plot_chain_traces( sampler, nburn=0, show_burn=True, thin_before_plotting=No
     npars = len( freepars )
     stepcount = np.arange( 1, nsteps+1 )
 
-    if thin_before_plotting==None:
+    if thin_before_plotting is None:
         if nsteps<2000:
             thin_before_plotting = 1
         else:
@@ -137,7 +136,7 @@ def plot_chain_densities( sampler, nburn=0, nbins=30, show_burn=True, thin_befor
     npars = len( freepars )
     stepcount = np.arange( 1, nsteps+1 )
 
-    if thin_before_plotting==None:
+    if thin_before_plotting is None:
         if nsteps<2000:
             thin_before_plotting = 1
         else:
@@ -189,10 +188,10 @@ def plot_chain_autocorrs( sampler, nburn=None, maxlag=None, thin_before_plotting
     """
 
     nsteps = sampler.nsteps - nburn
-    if maxlag==None:
+    if maxlag is None:
         maxlag = min( [ nsteps, 200 ] )
 
-    if nburn==None:
+    if nburn is None:
         nburn = 0
 
     chain = copy.deepcopy( sampler.chain )
@@ -200,7 +199,7 @@ def plot_chain_autocorrs( sampler, nburn=None, maxlag=None, thin_before_plotting
     npars = len( freepars )
     stepcount = np.arange( 1, nsteps+1 )
 
-    if thin_before_plotting==None:
+    if thin_before_plotting is None:
         if nsteps<2000:
             thin_before_plotting = 1
         else:
@@ -286,7 +285,7 @@ def gelman_rubin( chain_list, nburn=0 ):
     m = len( chain_list )
 
     keys = []
-    for key in chain_list[0].keys():
+    for key in chain_list[0]:
         if ( key=='logp' )+( key=='accepted' ):
             continue
         keys += [ key ]
@@ -317,19 +316,19 @@ def print_chain_properties( sampler, nburn=None, thin=None ):
     freepars = get_freepars( chain )
     npars = len( freepars )
 
-    print '\n{0}\nParameter --> Mean, Median, Stdev:'.format( '#'*50 )
+    print( '\n{0}\nParameter --> Mean, Median, Stdev:'.format( '#'*50 ) )
     for i in range( npars ):
         chain_i = chain[freepars[i]]
-        if nburn!=None:
+        if nburn is not None:
             chain_i = chain_i[nburn:]
         nsteps = len( chain_i )
-        if thin!=None:
+        if thin is not None:
             ixs = ( np.arange( nsteps )%thin==0 )
             chain_i = chain_i[ixs]
         mean = np.mean( chain_i )
         median = np.median( chain_i )
         stdev = np.std( chain_i )
-        print '  {0} --> {1}, {2}, {3}'.format( freepars[i], mean, median, stdev )
+        print( '  {0} --> {1}, {2}, {3}'.format( freepars[i], mean, median, stdev ) )
 
     return None
 
@@ -342,7 +341,7 @@ def get_freepars( chain ):
     except for the tallies of 'logp' and 'accepted'.
     """
     freepars = []
-    for key in chain.keys():
+    for key in chain:
         if np.any( key==np.array( [ 'logp', 'accepted' ] ) ):
             continue
         else:
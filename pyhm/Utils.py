@@ -1,13 +1,26 @@
 import numpy as np
-import cPickle
-import pdb, sys, time
+import pickle
+import random
+import sys
+import multiprocessing
+import functools
+import math
 try:
-    from ProgressBar import progressbar
+    from .ProgressBar import progressbar
     progressbar_imported = True
 except:
-    print '\nProblem importing ProgressBar - skipping'
-    print '(perhaps ipython not installed?)\n'
+    print( '\nProblem importing ProgressBar - skipping' )
+    print( '(perhaps ipython not installed?)\n' )
     progressbar_imported = False
+try:
+    from numba import njit
+    from numba.core.errors import TypingError
+    from numba.extending import is_jitted
+    numba_imported = True
+except ImportError:
+    numba_imported = False
+    class TypingError( Exception ):
+        pass
 
 """
 This module contains various utility routines, including the
@@ -15,43 +28,51 @@ backends for generating samples from a Model and taking random
 draws from a Model.
 """
 
-def sample( sampler, nsteps=1000, ntune_iterlim=None, tune_interval=None, show_progressbar=True, verbose=False ):
+# Number of steps between progress bar updates, and the maximum number
+# of steps for which random deviates are drawn at once:
+_PBAR_INTERVAL = 128
+_DRAW_BLOCK = 4096
+
+def sample( sampler, nsteps=1000, ntune_iterlim=None, tune_interval=None, show_progressbar=True, \
+            verbose=False, nchains=1, nworkers=None, logp_fn=None, thin_during_sampling=1 ):
     """
     Generate samples from the model posterior distribution.
+
+    If nchains>1, that many independent chains are generated in parallel
+    using up to nworkers forked processes on Linux (defaulting to the
+    number of CPUs), or one after another on other platforms, each with
+    an independent random number stream spawned from the rng attribute
+    of the sampler. The individual chains are then stored in a list as
+    the chains attribute of the sampler, and their concatenation is
+    stored as the chain attribute, with the individual chains given as
+    views onto the combined chain.
+
+    Optionally, logp_fn can be provided as a function that takes an array
+    of the free parameter values, ordered alphabetically by key, and
+    returns the log posterior. The sampling loop then operates directly
+    on arrays, as a Gaussian random walk with the step sizes of the
+    MetropolisHastings step method. The loop is compiled with Numba if
+    logp_fn is itself compiled with numba.njit, and otherwise runs as
+    plain Python.
+
+    If thin_during_sampling>1, only every thin_during_sampling-th step
+    is stored in the chain, starting with the first, and the nsteps
+    attribute of the sampler gives the number of samples stored.
     """
     
     # Check that a StepMethod has been assigned:
-    if sampler.step_method==None:
+    if sampler.step_method is None:
         err_str = 'Step method must be assigned before sampling can begin'
-        raise StandardError( err_str )
+        raise RuntimeError( err_str )
     else:
         step_method = sampler.step_method
 
-    sampler.nsteps = nsteps
-
-    # Initialise the chain:
-    sampler.chain = {}
-    sampler.chain['logp'] = np.zeros( nsteps, dtype=float )
-    sampler.chain['accepted'] = np.zeros( nsteps, dtype=int )
-    unobs_stochs = sampler.model.free
-    unobs_stochs_keys = unobs_stochs.keys()
-    for key in unobs_stochs_keys:
-        dtype = unobs_stochs[key].dtype
-        sampler.chain[key] = np.zeros( nsteps, dtype=dtype )
-
-    # Install the current unobserved stochastic values
-    # as the first step in the chain:
-    current_values = {}
-    for key in unobs_stochs_keys:
-        current_values[key] = unobs_stochs[key].value
-    current_logp = sampler.logp()
-    
     # Determine if there will be tuning:
-    if ( ntune_iterlim!=None )*( tune_interval!=None ):
+    if ( ntune_iterlim is not None )*( tune_interval is not None ):
         if hasattr( step_method, 'pre_tune' )==False:
             err_str = '\nStepMethod must have pre_tune() method assigned'
             raise ValueError( err_str )
-        elif tune_interval==None:
+        elif tune_interval is None:
             err_str = 'tune_interval must be set explicitly for pre-tuning'
             raise ValueError( err_str )
         else:
@@ -62,30 +83,392 @@ def sample( sampler, nsteps=1000, ntune_iterlim=None, tune_interval=None, show_p
         sampler.tune_interval = None
 
     # Proceed with the sampling:
-    if ( sampler.show_progressbar==True )*\
-       ( progressbar_imported==True ):
-        pbar = progressbar( nsteps )
-    for i in range( nsteps ):
-        if ( sampler.show_progressbar==True )*( ( i+1 )%100==0 )*\
-           ( progressbar_imported==True ):
-            pbar.animate( i+1 )
-        step_method.propose( unobs_stochs )
-        new_logp = sampler.logp()
-        sampler.chain['accepted'][i] = step_method.decide( current_logp, new_logp )
-        if sampler.chain['accepted'][i]==True:
+    if logp_fn is not None:
+        _check_array_step_method( step_method )
+    sampler.thin_during_sampling = thin_during_sampling
+    if nchains==1:
+        run_chain( sampler, nsteps, logp_fn=logp_fn, thin=thin_during_sampling )
+        return None
+
+    # Otherwise, each chain starts from the same point in parameter
+    # space but with an independent random number stream:
+    global _sample_state
+    unobs_stochs = sampler.model.free
+    start_values = {}
+    for key in unobs_stochs:
+        start_values[key] = unobs_stochs[key].value
+    seeds = np.random.SeedSequence( sampler.rng.integers( 2**63 ) ).spawn( nchains )
+    if nworkers is None:
+        nworkers = multiprocessing.cpu_count()
+    nworkers = min( [ nworkers, nchains ] )
+    if ( nworkers>1 ) and sys.platform.startswith( 'linux' ):
+        # The model cannot be pickled, so the worker processes must be
+        # forked in order to inherit it, which is only safe alongside
+        # numpy on Linux:
+        _sample_state = ( sampler, nsteps, start_values, logp_fn, thin_during_sampling )
+        pool = multiprocessing.get_context( 'fork' ).Pool( processes=nworkers )
+        try:
+            chains = pool.map( _run_single_chain, zip( range( nchains ), seeds ) )
+        finally:
+            pool.close()
+            pool.join()
+            _sample_state = None
+    else:
+        _sample_state = ( sampler, nsteps, start_values, logp_fn, thin_during_sampling )
+        try:
+            chains = list( map( _run_single_chain, zip( range( nchains ), seeds ) ) )
+        finally:
+            _sample_state = None
+
+    # Concatenate the chains into a single array of samples, with the
+    # individual chains and the combined chain given as views onto it:
+    keys = chains[0][0]
+    chain_arr = np.concatenate( [ chain[1] for chain in chains ] )
+    logp_arr = np.concatenate( [ chain[2] for chain in chains ] )
+    accepted = np.concatenate( [ chain[3] for chain in chains ] )
+    sampler.chains = []
+    offset = 0
+    for chain in chains:
+        ixs = slice( offset, offset+len( chain[2] ) )
+        sampler.chains += [ _chain_views( unobs_stochs, chain_arr[ixs], keys, \
+                                          logp_arr[ixs], accepted[ixs] ) ]
+        offset += len( chain[2] )
+    sampler.chain_arr = chain_arr
+    sampler.chain_keys = list( keys )
+    sampler.chain = _chain_views( unobs_stochs, chain_arr, keys, logp_arr, accepted )
+    sampler.nsteps = len( logp_arr )
+        
+    return None
+
+
+# State shared with the worker processes forked by sample():
+_sample_state = None
+
+def _run_single_chain( args ):
+    """
+    Generates one of the chains requested from sample(), using the
+    state installed in _sample_state beforehand. Only the first chain
+    displays a progress bar. The random number generators and the
+    parameter values are restored afterwards, so that running the
+    chains in the calling process has the same side effects as
+    running them in forked worker processes. Returns the chain keys,
+    the array of samples, the logp values and the accept/reject
+    decisions.
+    """
+
+    ichain, seed = args
+    sampler, nsteps, start_values, logp_fn, thin = _sample_state
+    rng = sampler.rng
+    np_random_state = np.random.get_state()
+    random_state = random.getstate()
+    show_progressbar = sampler.show_progressbar
+    unobs_stochs = sampler.model.free
+    try:
+        sampler.rng = np.random.default_rng( seed )
+        # The global generators are still used by step methods
+        # that draw their own proposals:
+        legacy_seed = int( seed.generate_state( 1 )[0] )
+        np.random.seed( legacy_seed )
+        random.seed( legacy_seed )
+        for key in start_values:
+            unobs_stochs[key].value = start_values[key]
+        if ichain>0:
+            sampler.show_progressbar = False
+        run_chain( sampler, nsteps, logp_fn=logp_fn, thin=thin )
+    finally:
+        sampler.rng = rng
+        np.random.set_state( np_random_state )
+        random.setstate( random_state )
+        sampler.show_progressbar = show_progressbar
+        for key in start_values:
+            unobs_stochs[key].value = start_values[key]
+
+    return sampler.chain_keys, sampler.chain_arr, sampler.chain['logp'], sampler.chain['accepted']
+
+
+def run_chain( sampler, nsteps, logp_fn=None, thin=1 ):
+    """
+    Generates a single chain of samples from the model posterior
+    distribution, starting from the current parameter values, and
+    installs it as the chain attribute of the sampler. Only every
+    thin-th step is stored.
+    """
+
+    step_method = sampler.step_method
+    nstored = ( nsteps+thin-1 )//thin
+    sampler.nsteps = nstored
+    if logp_fn is not None:
+        run_chain_arrays( sampler, nsteps, logp_fn, thin=thin )
+        return None
+
+    # Initialise the chain, with the free parameter values stored
+    # as the rows of a single contiguous array:
+    unobs_stochs = sampler.model.free
+    unobs_stochs_keys = list( unobs_stochs.keys() )
+    npars = len( unobs_stochs_keys )
+    chain_arr = np.zeros( [ nstored, npars ], dtype=float )
+    logp_arr = np.zeros( nstored, dtype=float )
+    accepted_bits = np.zeros( ( nstored+7 )//8, dtype=np.uint8 )
+
+    # Install the current unobserved stochastic values
+    # as the first step in the chain:
+    stoch_objs = [ unobs_stochs[key] for key in unobs_stochs_keys ]
+    state_vec = np.empty( npars, dtype=float )
+    for j in range( npars ):
+        state_vec[j] = stoch_objs[j].value
+    current_logp = sampler.logp()
+
+    # Select the version of the sampling loop once, so that the
+    # progress bar is not checked at every step:
+    loop_args = ( step_method, sampler.logp, sampler.rng, unobs_stochs, unobs_stochs_keys, \
+                  stoch_objs, state_vec, thin, chain_arr, logp_arr, accepted_bits )
+    if sampler.show_progressbar and progressbar_imported:
+        _run_with_pbar( loop_args, current_logp, nsteps )
+    else:
+        _run_no_pbar( loop_args, current_logp, nsteps )
+    install_chain( sampler, chain_arr, unobs_stochs_keys, logp_arr, accepted_bits )
+        
+    return None
+
+
+def _run_no_pbar( loop_args, current_logp, nsteps ):
+    """
+    Runs the sampling loop for run_chain() without a progress bar,
+    in blocks of _DRAW_BLOCK steps.
+    """
+
+    for istart in range( 0, nsteps, _DRAW_BLOCK ):
+        iend = min( [ istart+_DRAW_BLOCK, nsteps ] )
+        current_logp = _run_steps( loop_args, current_logp, istart, iend )
+
+    return current_logp
+
+
+def _run_with_pbar( loop_args, current_logp, nsteps ):
+    """
+    Runs the sampling loop for run_chain() in blocks of _PBAR_INTERVAL
+    steps, updating the progress bar after each block.
+    """
+
+    pbar = progressbar( nsteps )
+    for istart in range( 0, nsteps, _PBAR_INTERVAL ):
+        iend = min( [ istart+_PBAR_INTERVAL, nsteps ] )
+        current_logp = _run_steps( loop_args, current_logp, istart, iend )
+        pbar.animate( iend )
+
+    return current_logp
+
+
+def _run_steps( loop_args, current_logp, istart, iend ):
+    """
+    Takes Metropolis-Hastings steps istart to iend-1 for run_chain(),
+    recording every thin-th step in the chain arrays, and returns the
+    log posterior of the final state.
+    """
+
+    # Bind loop invariants to local names:
+    step_method, get_logp, rng, unobs_stochs, unobs_stochs_keys, stoch_objs, \
+        state_vec, thin, chain_arr, logp_arr, accepted_bits = loop_args
+
+    # Draw the proposal steps and uniform deviates for this block
+    # of iterations at once if the step method allows it:
+    batched = hasattr( step_method, 'draw_proposals' )
+    if batched:
+        steps = step_method.draw_proposals( unobs_stochs, iend-istart, rng=rng )
+        unif = rng.random( iend-istart )
+    if hasattr( step_method, 'step' ):
+        step = step_method.step
+    else:
+        step = functools.partial( _default_step, step_method )
+
+    # Only the parameters perturbed by the step method need to be
+    # copied on acceptance or restored on rejection. Their indices are
+    # recomputed whenever the step method replaces touched_keys:
+    npars = len( unobs_stochs_keys )
+    key_ixs = dict( zip( unobs_stochs_keys, range( npars ) ) )
+    all_ixs = list( range( npars ) )
+    touched_keys = None
+    touched_ixs = all_ixs
+    
+    for i in range( istart, iend ):
+        if batched:
+            new_logp, accepted = step( unobs_stochs, current_logp, get_logp, \
+                                       steps[i-istart], unif[i-istart] )
+        else:
+            new_logp, accepted = step( unobs_stochs, current_logp, get_logp )
+        if getattr( step_method, 'touched_keys', None ) is not touched_keys:
+            touched_keys = step_method.touched_keys
+            if touched_keys is None:
+                touched_ixs = all_ixs
+            else:
+                touched_ixs = [ key_ixs[key] for key in touched_keys ]
+        if accepted:
             current_logp = new_logp
-            for key in unobs_stochs_keys:
-                current_values[key] = unobs_stochs[key].value
+            for j in touched_ixs:
+                state_vec[j] = stoch_objs[j].value
         else:
-            for key in unobs_stochs_keys:
-                unobs_stochs[key].value = current_values[key]
-        for key in unobs_stochs_keys:
-            sampler.chain[key][i] = unobs_stochs[key].value
-        sampler.chain['logp'][i] = current_logp
-    if ( sampler.show_progressbar==True )*\
-       ( progressbar_imported==True ):
-        pbar.animate( nsteps )
+            for j in touched_ixs:
+                stoch_objs[j].value = state_vec[j]
+        if i%thin==0:
+            k = i//thin
+            chain_arr[k,:] = state_vec
+            logp_arr[k] = current_logp
+            if accepted:
+                accepted_bits[k>>3] |= 1<<( k&7 )
         
+    return current_logp
+
+
+def _default_step( step_method, unobs_stochs, current_logp, get_logp, steps=None, z=None ):
+    """
+    Equivalent of the step() method for step methods that only
+    provide propose() and decide().
+    """
+
+    if steps is None:
+        step_method.propose( unobs_stochs )
+    else:
+        step_method.propose( unobs_stochs, steps )
+    new_logp = get_logp()
+    if z is None:
+        accepted = step_method.decide( current_logp, new_logp )
+    else:
+        accepted = step_method.decide( current_logp, new_logp, z )
+
+    return new_logp, accepted
+
+
+def install_chain( sampler, chain_arr, keys, logp_arr, accepted_bits ):
+    """
+    Installs an array of samples, with one column per free parameter
+    in the same order as keys, as the chain_arr attribute of the sampler.
+    The chain attribute is set to a dictionary of views onto its columns,
+    together with the logp array and the accept/reject decisions, which
+    are given packed into the bits of accepted_bits and are unpacked into
+    an array of zeros and ones with one byte per sample.
+    """
+
+    accepted = np.unpackbits( accepted_bits, count=len( logp_arr ), bitorder='little' )
+    sampler.chain_arr = chain_arr
+    sampler.chain_keys = list( keys )
+    sampler.chain = _chain_views( sampler.model.free, chain_arr, keys, logp_arr, accepted )
+
+    return None
+
+
+def _chain_views( unobs_stochs, chain_arr, keys, logp_arr, accepted ):
+    """
+    Returns a chain dictionary with views onto the columns of chain_arr
+    for each of the keys, along with the logp values and accept/reject
+    decisions. Columns are only copied if the Stoch has another dtype.
+    """
+
+    chain = {}
+    chain['logp'] = logp_arr
+    chain['accepted'] = accepted
+    for j in range( len( keys ) ):
+        dtype = unobs_stochs[keys[j]].dtype
+        if np.dtype( dtype )==chain_arr.dtype:
+            chain[keys[j]] = chain_arr[:,j]
+        else:
+            chain[keys[j]] = chain_arr[:,j].astype( dtype )
+
+    return chain
+
+
+def _mh_loop( logp_fn, state, current_logp, sigma, noise, unif, istart, thin, \
+              chain_arr, logp_arr, accepted_bits ):
+    """
+    Metropolis-Hastings loop operating on a flat array of parameter
+    values, taking steps istart onwards of the chain with the Gaussian
+    proposal steps and uniform deviates drawn beforehand. Every thin-th
+    step is stored. Returns the final state and its log posterior.
+    """
+
+    for n in range( noise.shape[0] ):
+        proposed = state + sigma*noise[n,:]
+        new_logp = logp_fn( proposed )
+        beta = new_logp - current_logp
+        accepted = ( beta>0 ) or ( unif[n]<=math.exp( min( beta, 0.0 ) ) )
+        if accepted:
+            state = proposed
+            current_logp = new_logp
+        i = istart + n
+        if i%thin==0:
+            k = i//thin
+            chain_arr[k,:] = state
+            logp_arr[k] = current_logp
+            if accepted:
+                accepted_bits[k>>3] |= 1<<( k&7 )
+
+    return state, current_logp
+
+if numba_imported==True:
+    _mh_loop = njit( cache=True )( _mh_loop )
+
+
+def _check_array_step_method( step_method ):
+    """
+    Checks that the step method is a MetropolisHastings Gaussian random
+    walk, which is the only case run_chain_arrays() can reproduce.
+    """
+
+    from .BuiltinStepMethods import MetropolisHastings
+    if ( isinstance( step_method, MetropolisHastings )==False ) \
+       or ( step_method.proposal_distribution is not gaussian_random_draw ):
+        err_str = 'logp_fn can only be used with the MetropolisHastings step method'
+        err_str += ' and a gaussian_random_draw proposal distribution'
+        raise ValueError( err_str )
+
+    return None
+
+
+def run_chain_arrays( sampler, nsteps, logp_fn, thin=1 ):
+    """
+    Equivalent to run_chain() for a Gaussian random walk, but with the
+    model log posterior evaluated by logp_fn on an array of the free
+    parameter values, ordered alphabetically by key. The compiled loop
+    is only used if logp_fn is compiled with Numba as well.
+    """
+
+    step_method = sampler.step_method
+    _check_array_step_method( step_method )
+    mh_loop = _mh_loop
+    if ( numba_imported==True ) and ( is_jitted( logp_fn )==False ):
+        mh_loop = _mh_loop.py_func
+    unobs_stochs = sampler.model.free
+    keys = sorted( unobs_stochs.keys() )
+    npars = len( keys )
+    state = np.zeros( npars, dtype=float )
+    sigma = np.zeros( npars, dtype=float )
+    for j in range( npars ):
+        state[j] = unobs_stochs[keys[j]].value
+        sigma[j] = step_method.step_sizes[keys[j]]
+    nstored = ( nsteps+thin-1 )//thin
+    chain_arr = np.zeros( [ nstored, npars ], dtype=float )
+    logp_arr = np.zeros( nstored, dtype=float )
+    accepted_bits = np.zeros( ( nstored+7 )//8, dtype=np.uint8 )
+
+    # The random deviates are drawn in blocks of _DRAW_BLOCK steps
+    # to bound the memory used alongside a thinned chain:
+    current_logp = logp_fn( state )
+    for istart in range( 0, nsteps, _DRAW_BLOCK ):
+        nblock = min( [ _DRAW_BLOCK, nsteps-istart ] )
+        noise = sampler.rng.standard_normal( size=[ nblock, npars ] )
+        unif = sampler.rng.random( nblock )
+        loop_args = ( logp_fn, state, current_logp, sigma, noise, unif, \
+                      istart, thin, chain_arr, logp_arr, accepted_bits )
+        try:
+            state, current_logp = mh_loop( *loop_args )
+        except TypingError:
+            # Fall back to plain Python if the loop cannot be compiled
+            # for this logp_fn:
+            mh_loop = _mh_loop.py_func
+            state, current_logp = mh_loop( *loop_args )
+    for j in range( npars ):
+        unobs_stochs[keys[j]].value = state[j]
+    install_chain( sampler, chain_arr, keys, logp_arr, accepted_bits )
+
     return None
 
 
@@ -97,54 +480,74 @@ def random_draw_from_Model( model ):
     """
     
     unobs_stochs = model.free
-    keys = unobs_stochs.keys()
-    ancestries = []
-    for key in keys:
-        ancestries += [ model._ancestries[key] ]
-    keys = np.array( keys, dtype=str )
-    ancestries = np.array( ancestries, dtype=int )
-    ixs = np.argsort( ancestries )
-    keys = keys[ixs]
-    ancestries = ancestries[ixs]
-    for key in keys:
+    for key in sorted( unobs_stochs.keys(), key=model._ancestries.get ):
         unobs_stochs[key].random()
         
     return None
 
 
-def pickle_chain( sampler, pickle_chain=None, thin_before_pickling=1 ):
+def pickle_chain( sampler, pickle_chain=None, thin_before_pickling=1, dtype=float ):
     """
-    Pickles the chain of samples generated from the model
-    posterior distribution.
+    Saves the chain of samples generated from the model posterior
+    distribution. The parameter samples are packed into a single
+    [ nsteps, npars ] array of the given dtype, which is written
+    together with the logp values and accept/reject decisions to a
+    compressed numpy archive. Passing dtype=np.float32 halves the size
+    of the parameter samples at the cost of precision; the logp values
+    are always stored at full precision.
+
+    The thinning factor thin_before_pickling is relative to the steps
+    taken, so it is reduced accordingly (rounding down) if the chain
+    was already thinned during sampling.
     """
     
-    if pickle_chain==None:
+    if pickle_chain is None:
         pickle_chain = 'chain.pkl'
 
-    if thin_before_pickling>1:
-        ixs = ( np.arange( sampler.nsteps )%thin_before_pickling==0 )
-    else:
-        ixs = np.arange( sampler.nsteps )
-    ochain = {}
-    for key in sampler.chain.keys():
-        ochain[key] = sampler.chain[key][ixs]
-
-    opickle_file = open( pickle_chain, 'w' )
-    cPickle.dump( ochain, opickle_file )
-    opickle_file.close()
-    print '\nPickled chain as:\n  {0}'.format( pickle_chain )
+    thin = thin_before_pickling//getattr( sampler, 'thin_during_sampling', 1 )
+    ixs = slice( None, None, max( [ thin, 1 ] ) )
+    keys = [ key for key in sampler.chain if ( key!='logp' ) and ( key!='accepted' ) ]
+    keys = sorted( keys )
+    chain_arr = np.column_stack( [ sampler.chain[key][ixs] for key in keys ] ).astype( dtype )
+    dtypes = [ sampler.chain[key].dtype.str for key in keys ]
+
+    # Pass an open file, as np.savez_compressed() would otherwise
+    # append .npz to the file name:
+    with open( pickle_chain, 'wb' ) as ofile:
+        np.savez_compressed( ofile, chain_arr=chain_arr, keys=np.array( keys ), \
+                             dtypes=np.array( dtypes ), \
+                             logp=sampler.chain['logp'][ixs], \
+                             accepted=np.packbits( sampler.chain['accepted'][ixs]!=0, \
+                                                   bitorder='little' ) )
+    print( '\nPickled chain as:\n  {0}'.format( pickle_chain ) )
 
     return None
 
 
 def load_chain( chain_filename ):
     """
-    Uses cPickle to load a pickled chain.
+    Loads a chain saved by pickle_chain(), returning a dictionary
+    with an array of samples for each parameter, along with the logp
+    values and accept/reject decisions. Chains pickled as dictionaries
+    by earlier versions are also accepted.
     """
     
-    ifile = open( chain_filename, 'r' )
-    chain = cPickle.load( ifile )
-    ifile.close()
+    with open( chain_filename, 'rb' ) as ifile:
+        # Numpy archives are zip files:
+        if ifile.read( 2 )!=b'PK':
+            # Older chains were written by Python 2, so their str
+            # payloads must be decoded as latin1:
+            ifile.seek( 0 )
+            return pickle.load( ifile, encoding='latin1' )
+        ifile.seek( 0 )
+        archive = np.load( ifile )
+        chain_arr = archive['chain_arr']
+        chain = {}
+        for j, ( key, dtype ) in enumerate( zip( archive['keys'], archive['dtypes'] ) ):
+            chain[str( key )] = chain_arr[:,j].astype( dtype )
+        chain['logp'] = archive['logp'].astype( float )
+        chain['accepted'] = np.unpackbits( archive['accepted'], count=len( chain['logp'] ), \
+                                           bitorder='little' )
 
     return chain
 
@@ -197,46 +600,35 @@ def trace_ancestries( model ):
     """
 
     ancestries = {}
-    # Go through each unobserved Stochastic object
-    # one at a time:
+    # Generation counts are cached by object so that lineages
+    # shared between Stochastics are only traced once:
+    cache = {}
     unobs_stochs = model.free
     for stoch_key in unobs_stochs:
-        stoch = unobs_stochs[stoch_key]
-        # Initialise the flags that will be used to determine
-        # whether or not we've hit the top level of the model
-        # heirarchy:
-        counter = 0
-        reached_base = False
-        current_parents = stoch.parents
-        while reached_base==False:
-            parent_keys = current_parents.keys()
-            grandparents = {}
-            stoch_checks = []
-            # Cycle through each parent in the current level
-            # and record if they are stochastics or not:
-            for parent_key in parent_keys:
-                parent = current_parents[parent_key]
-                try:
-                    parent_stoch = parent.is_stochastic
-                except:
-                    parent_stoch = False
-                stoch_checks += [ parent_stoch ]
-                # If the current parent being examined is an
-                # unobserved stochastic, then add it to the
-                # group of grandparents for the next level:
-                if parent_stoch==True:
-                    for grandparent_key in parent.parents.keys():
-                        grandparents[grandparent_key] = parent.parents[grandparent_key]
-                    
-            counter += 1
-            if max( stoch_checks )==False:
-                reached_base = True
-            else:
-                current_parents = grandparents
-        ancestries[stoch_key] = counter
+        ancestries[stoch_key] = _count_generations( unobs_stochs[stoch_key], cache )
     model._ancestries = ancestries
     
     return None
+
+
+def _count_generations( stoch, cache ):
+    """
+    Returns the maximum number of generations along the lineages of a
+    Stochastic before a non-stochastic parent is reached, i.e. one more
+    than the maximum generation count of its stochastic parents.
+    """
+
+    ident = id( stoch )
+    if ident not in cache:
+        counter = 1
+        for parent in stoch.parents.values():
+            if getattr( parent, 'is_stochastic', False )==True:
+                generations = 1 + _count_generations( parent, cache )
+                if generations>counter:
+                    counter = generations
+        cache[ident] = counter
+
+    return cache[ident]
     
 
 def observed_stochastics( stochastics ):
@@ -246,14 +638,10 @@ def observed_stochastics( stochastics ):
     """
     
     true_stochastics = identify_stochastics( stochastics )
-    keys = true_stochastics.keys()
     observed_stochastics = {}
-    for key in keys:
-        stochastic = true_stochastics[key]
+    for key, stochastic in true_stochastics.items():
         if stochastic.observed==True:
             observed_stochastics[key] = stochastic
-        else:
-            continue
 
     return observed_stochastics
 
@@ -265,14 +653,10 @@ def unobserved_stochastics( stochastics ):
     """
 
     true_stochastics = identify_stochastics( stochastics )
-    keys = true_stochastics.keys()
     unobserved_stochastics = {}
-    for key in keys:
-        stochastic = true_stochastics[key]
+    for key, stochastic in true_stochastics.items():
         if stochastic.observed==False:
             unobserved_stochastics[key] = stochastic
-        else:
-            continue
 
     return unobserved_stochastics
 
@@ -283,15 +667,10 @@ def identify_stochastics( dictionary ):
     new dictionary containing only the Stochs.
     """
 
-    keys = dictionary.keys()
     stochastics = {}
-    for key in keys:
-        item = dictionary[key]
-        try:
-            if item.is_stochastic==True:
-                stochastics[key] = item
-        except:
-            continue
+    for key, item in dictionary.items():
+        if getattr( item, 'is_stochastic', False )==True:
+            stochastics[key] = item
         
     return stochastics
 
@@ -302,63 +681,95 @@ def stochastics_values( dictionary ):
     any Stochs contained in an input dictionary.
     """
     
-    keys = dictionary.keys()
     values = {}
-    for key in keys:
-        var = dictionary[key]
-        try:
-            if var.is_stochastic==True:
-                values[key] = var.value
-        except:
+    for key, var in dictionary.items():
+        if getattr( var, 'is_stochastic', False )==True:
+            values[key] = var.value
+        else:
             values[key] = var
             
     return values
 
 
-def extract_stochastics_values( dictionary ):
+def extract_stochastics_values( dictionary, plan=None ):
     """
     Takes as input a dictionary of variables and converts any
     Stochs to numerical values, including those that are
     contained in lists. The output is a new dictionary containing
     these numerical values.
+
+    The kind of each entry is given by plan, as returned by
+    extraction_plan() for the same dictionary; this allows callers
+    that evaluate the same dictionary repeatedly to build it once.
     """
     
-    kwargs = {}
-    for key in dictionary.keys():
+    if plan is None:
+        plan = extraction_plan( dictionary )
 
+    kwargs = {}
+    for key, kind, element_kinds in plan:
         element = dictionary[key]
-        
+        if kind==_STOCH_LIST:
+            kwargs[key] = [ _apply_kind( k, e ) for k, e in zip( element_kinds, element ) ]
+        else:
+            kwargs[key] = _apply_kind( kind, element )
+                
+    return kwargs
+
+
+# Kinds of entry in an extraction plan:
+_PASSTHROUGH = 0
+_SCALAR_STOCH = 1
+_VECTOR_STOCH = 2
+_STOCH_LIST = 3
+
+def extraction_plan( dictionary ):
+    """
+    Returns a list of ( key, kind, element_kinds ) for the entries of
+    a dictionary of variables, where element_kinds gives the kinds of
+    the elements for entries that are lists and is otherwise None.
+    """
+
+    plan = []
+    for key, element in dictionary.items():
         # Allow for the possibility that a list of
         # stochastics has been provided as a parent:
         if type( element )==list:
+            plan += [ ( key, _STOCH_LIST, [ _value_kind( e ) for e in element ] ) ]
+        else:
+            plan += [ ( key, _value_kind( element ), None ) ]
 
-            kwargs[key] = []
-            for element in element:
+    return plan
 
-                try:
-                    if element.is_stochastic==True:
-                        if np.size( element.value )==1:
-                            kwargs[ key ] += [ float( element.value ) ]
-                        else:
-                            kwargs[ key ] += [ element.value ]
-                    else:
-                        kwargs[ key ] += [ element ]
-                except:
-                    kwargs[ key ] += [ element ]
 
+def _value_kind( element ):
+    """
+    Classifies a variable as a scalar Stoch, a non-scalar
+    Stoch, or something else to be passed through unchanged.
+    """
+
+    if getattr( element, 'is_stochastic', False )==True:
+        value = element.value
+        if isinstance( value, ( float, int, np.floating, np.integer ) ) \
+           or ( np.size( value )==1 ):
+            return _SCALAR_STOCH
         else:
-            try:
-                if element.is_stochastic==True:
-                    if np.size( element.value )==1:
-                        kwargs[key] = float( element.value )
-                    else:
-                        kwargs[key] = element.value
-                else:
-                    kwargs[key] = element
-            except:
-                kwargs[key] = element
-                
-    return kwargs
+            return _VECTOR_STOCH
+    else:
+        return _PASSTHROUGH
+
+
+def _apply_kind( kind, element ):
+    """
+    Returns the value of a variable according to its kind.
+    """
+
+    if kind==_SCALAR_STOCH:
+        return float( element.value )
+    elif kind==_VECTOR_STOCH:
+        return element.value
+    else:
+        return element
 
 
 def check_model_stochastics_names( model ):
@@ -367,16 +778,13 @@ def check_model_stochastics_names( model ):
     the same name in a given Model.
     """
     
-    stochastics = model.stochastics
-    nstoch = len( stochastics )
-    names = []
-    for key in stochastics.keys():
-        names += [ stochastics[key].name ]
-    names = np.array( names, dtype=str )
-    unique_names = np.unique( names )
-    if nstoch!=len( unique_names ):
-        err_str = 'Model variables do not all have unique names'
-        raise ValueError( err_str )
+    names = set()
+    for stochastic in model.stochastics.values():
+        if stochastic.name in names:
+            err_str = 'Model variables do not all have unique names ' + \
+                      '(duplicate name {0!r})'.format( stochastic.name )
+            raise ValueError( err_str )
+        names.add( stochastic.name )
 
     return None
         
@@ -394,17 +802,17 @@ def combine_chains( chain_list, nburn=0, thin=1 ):
     This is done separately for each parameter in the chain.
     """
     
-    m = len( chain_list )
-    keys = chain_list[0].keys()
     combined = {}
-    for key in keys:
-        combined[key] = []
-        for i in range( m ):
-            chain = chain_list[i][key][nburn:]
-            n = len( chain.flatten() )
-            ixs = ( np.arange( n )%thin==0 )
-            combined[key] += [ chain[ixs] ]
-        combined[key] = np.concatenate( combined[key] )
+    for key in chain_list[0]:
+        # Burning and thinning by slicing gives views, which are then
+        # copied once into the preallocated output array:
+        pieces = [ chain[key][nburn::thin] for chain in chain_list ]
+        nsamples = sum( [ len( piece ) for piece in pieces ] )
+        combined[key] = np.empty( ( nsamples, )+pieces[0].shape[1:], dtype=pieces[0].dtype )
+        offset = 0
+        for piece in pieces:
+            combined[key][offset:offset+len( piece )] = piece
+            offset += len( piece )
 
     return combined
     
@@ -417,15 +825,19 @@ def blank_random():
     been defined.
     """
     
-    print '\nRandom not defined\n'
+    print( '\nRandom not defined\n' )
 
     return None
 
 
-def gaussian_random_draw( mu=0.0, sigma=1.0 ):
+def gaussian_random_draw( mu=0.0, sigma=1.0, rng=None ):
     """
     Draw a random sample from a 1D Gaussian distribution
-    that has mean mu and standard deviation sigma.
+    that has mean mu and standard deviation sigma, using the
+    numpy Generator rng if provided.
     """
     
-    return np.random.normal( mu, sigma )
+    if rng is None:
+        return np.random.normal( mu, sigma )
+    else:
+        return rng.normal( mu, sigma )
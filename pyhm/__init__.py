@@ -1,8 +1,8 @@
-from ModelObjs import *
-from BuiltinStochastics import *
-import Utils
-import Optimizers
-from InstantiationDecorators import stochastic
-from Utils import load_chain, combine_chains
-from SampleDiagnostics import plot_running_chain_means, plot_chain_traces, plot_chain_densities, plot_chain_autocorrs, print_chain_properties, gelman_rubin
+from .ModelObjs import *
+from .BuiltinStochastics import *
+from . import Utils
+from . import Optimizers
+from .InstantiationDecorators import stochastic
+from .Utils import load_chain, combine_chains
+from .SampleDiagnostics import plot_running_chain_means, plot_chain_traces, plot_chain_densities, plot_chain_autocorrs, print_chain_properties, gelman_rubin
 